@@ -1,15 +1,27 @@
 import os
 import sys
 import shutil
+import time
+import threading
+import traceback
+import hashlib
+import io
+import random
+import math
+import queue
+from collections import deque
+from multiprocessing import freeze_support
 from datetime import datetime
 from dotenv import load_dotenv, set_key
-from openai import OpenAI
+from openai import OpenAI, RateLimitError, APIConnectionError, APIStatusError, InternalServerError, ConflictError
+from PIL import Image, ImageDraw
 import base64
+from renditions import load_export_presets, file_hash, render_renditions, get_pool, shutdown_pool
 from PySide6.QtCore import Qt, Signal, QEvent, QDir, QObject, QRunnable, QThreadPool, Slot, QTimer
 from PySide6.QtGui import QPixmap, QGuiApplication, QAction, QIcon, QPainter, QColor
 from PySide6.QtWidgets import (
     QMainWindow, QApplication, QLabel, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout, QFileDialog, QDialog,
-    QStackedWidget, QWidget, QSpacerItem, QSizePolicy, QListWidget, QToolBar, QDialogButtonBox
+    QStackedWidget, QWidget, QSpacerItem, QSizePolicy, QListWidget, QToolBar, QDialogButtonBox, QAbstractItemView
 )
 
 
@@ -23,6 +35,415 @@ load_dotenv(os.path.join(base, ".env"), override=True)
 api_key = os.getenv("OPENAI_API_KEY", "")
 client = OpenAI(api_key=api_key)
 
+image_backend = os.getenv("IMAGE_BACKEND", "openai")
+hedge_enabled = os.getenv("HEDGE", "0") not in ("", "0")
+hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", "95"))
+if not 0 < hedge_percentile < 100:
+    sys.exit(f"HEDGE_PERCENTILE must be between 0 and 100, got {hedge_percentile:g}")
+hedge_delay_s = float(os.getenv("HEDGE_DELAY_S", "60"))
+
+initial_concurrency = int(os.getenv("INITIAL_CONCURRENCY", "2"))
+max_concurrency = int(os.getenv("MAX_CONCURRENCY", "8"))
+max_retries = int(os.getenv("MAX_RETRIES", "3"))
+
+watchdog_enabled = os.getenv("WATCHDOG", "") not in ("", "0")
+watchdog_threshold_ms = int(os.getenv("WATCHDOG_THRESHOLD_MS", "250"))
+
+def export_presets_path():
+    return os.path.join(base, "export_presets.json")
+
+
+def header_number(headers, name):
+    try:
+        return float(headers.get(name))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class ConcurrencyController:
+    # AIMD window on in-flight requests: grows by about one slot per window of successful
+    # requests, halves on a 429 and is capped by the rate-limit headers the API sends back
+    def __init__(self, initial=2, minimum=1, maximum=8, decrease=0.5, latency_factor=3, baseline_samples=20):
+        self.window = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.baseline_samples = baseline_samples
+
+        self.in_flight = 0
+        # operation -> recent latencies; the baseline is their minimum, so it follows the
+        # upstream instead of sticking at the fastest response ever seen
+        self._recent = {}
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, cancelled=None):
+        # Returns False without taking a slot if cancelled() turns true while waiting
+        with self._cond:
+            while self.in_flight >= int(self.window):
+                if cancelled is not None and cancelled():
+                    return False
+                self._cond.wait(timeout=0.25)
+
+            if cancelled is not None and cancelled():
+                return False
+
+            self.in_flight += 1
+            return True
+
+    def baseline(self, operation):
+        recent = self._recent.get(operation)
+        return min(recent) if recent else None
+
+    def release(self, latency=None, throttled=False, headers=None, operation=None):
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+
+            if throttled:
+                # Requests that were already in flight will often 429 together; count that as one signal
+                if now - self._last_decrease > (self.baseline(operation) or 1.0):
+                    self.window = max(self.minimum, self.window * self.decrease)
+                    self._last_decrease = now
+
+            elif latency is not None:
+                recent = self._recent.setdefault(operation, deque(maxlen=self.baseline_samples))
+                recent.append(latency)
+
+                # Slow responses mean the upstream is queueing, so hold the window instead of growing it
+                if latency <= self.baseline(operation) * self.latency_factor:
+                    self.window = min(self.maximum, self.window + 1 / self.window)
+
+            remaining = header_number(headers, "x-ratelimit-remaining-requests")
+            if remaining is not None:
+                self.window = max(self.minimum, min(self.window, remaining))
+
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return self.window, self.in_flight
+
+
+concurrency_controllers = {}
+concurrency_lock = threading.Lock()
+
+
+def get_controller(key):
+    # One controller per API key, since each key has its own rate limits
+    key_id = hashlib.sha256((key or "").encode()).hexdigest()[:12]
+
+    with concurrency_lock:
+        if key_id not in concurrency_controllers:
+            concurrency_controllers[key_id] = ConcurrencyController(initial=initial_concurrency, maximum=max_concurrency)
+        return concurrency_controllers[key_id]
+
+
+def is_transient(error):
+    # The errors the SDK itself would retry, apart from 429s which are handled separately
+    if isinstance(error, (APIConnectionError, InternalServerError, ConflictError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code == 408
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(self, client, model="gpt-image-1", controller=None, retries=3):
+        # The SDK's own retries would hide 429s from the controller and count their backoff
+        # as latency, so this class owns the retry policy
+        self.client = client.with_options(max_retries=0)
+        self.model = model
+        self.controller = controller or get_controller(client.api_key)
+        self.retries = retries
+
+    def generate(self, prompt, state=None):
+        def request():
+            return self.client.images.with_raw_response.generate(
+                model=self.model,
+                prompt=prompt,
+                quality="high"
+            )
+
+        return self._request("generate", request, state)
+
+    def edit(self, prompt, image_path, state=None):
+        def request():
+            with open(image_path, "rb") as image:
+                return self.client.images.with_raw_response.edit(
+                    model=self.model,
+                    image=image,
+                    prompt=prompt
+                )
+
+        return self._request("edit", request, state)
+
+    def _request(self, operation, request, state=None):
+        state = state or RequestState()
+        attempt = 0
+
+        while True:
+            # A hedge that lost while it was still queued must not go on to send a billed request
+            if not self.controller.acquire(cancelled=lambda: state.cancelled):
+                raise RequestCancelled()
+
+            start = time.monotonic()
+            state.on_wire_since = start
+
+            try:
+                raw = request()
+
+            except RateLimitError as e:
+                state.on_wire_since = None
+                self.controller.release(throttled=True, headers=e.response.headers, operation=operation)
+
+                # Out of quota won't fix itself by waiting
+                if attempt >= self.retries or e.code == "insufficient_quota" or state.cancelled:
+                    raise
+
+                delay = header_number(e.response.headers, "retry-after") or 2 ** attempt
+                print(f"Rate limited, retrying in {delay:.1f}s")
+
+            except Exception as e:
+                state.on_wire_since = None
+                self.controller.release()
+
+                # Connection drops, timeouts and server errors are worth another try, but
+                # they say nothing about our rate limit
+                if not is_transient(e) or attempt >= self.retries or state.cancelled:
+                    raise
+
+                delay = 2 ** attempt
+                print(f"Request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+
+            else:
+                state.on_wire_since = None
+                # Mark the answer found before freeing the slot, so a queued hedge can't grab it
+                state.cancel()
+                latency = time.monotonic() - start
+                latency_tracker(self.name, operation).record(latency)
+                self.controller.release(latency=latency, headers=raw.headers, operation=operation)
+
+                result = raw.parse()
+                return base64.b64decode(result.data[0].b64_json)
+
+            time.sleep(delay)
+            attempt += 1
+
+
+class LocalBackend:
+    # Offline backend: draws a pattern seeded from the prompt (and source image), so the
+    # same request always gives the same picture
+    name = "local"
+
+    def __init__(self, size=1024):
+        self.size = size
+
+    def generate(self, prompt, state=None):
+        start = time.monotonic()
+        if state is not None:
+            state.on_wire_since = start
+        seed = hashlib.sha256(prompt.encode()).hexdigest()
+        image = self._encode(self._draw(seed, (self.size, self.size)))
+
+        latency_tracker(self.name, "generate").record(time.monotonic() - start)
+        return image
+
+    def edit(self, prompt, image_path, state=None):
+        start = time.monotonic()
+        if state is not None:
+            state.on_wire_since = start
+        seed = hashlib.sha256(prompt.encode() + file_hash(image_path).encode()).hexdigest()
+
+        with Image.open(image_path) as source:
+            source = source.convert("RGBA")
+
+        overlay = self._draw(seed, source.size)
+        image = self._encode(Image.blend(source, overlay, 0.5))
+
+        latency_tracker(self.name, "edit").record(time.monotonic() - start)
+        return image
+
+    def _draw(self, seed, size):
+        rng = random.Random(seed)
+        width, height = size
+
+        top = tuple(rng.randrange(256) for _ in range(3))
+        bottom = tuple(rng.randrange(256) for _ in range(3))
+        gradient = Image.linear_gradient("L").resize(size)
+        im = Image.composite(Image.new("RGBA", size, bottom + (255,)), Image.new("RGBA", size, top + (255,)), gradient)
+
+        draw = ImageDraw.Draw(im, "RGBA")
+        for _ in range(rng.randint(8, 24)):
+            x, y = rng.randrange(width), rng.randrange(height)
+            r = rng.randint(min(size) // 20, min(size) // 4)
+            fill = tuple(rng.randrange(256) for _ in range(3)) + (rng.randint(80, 200),)
+            if rng.random() < 0.5:
+                draw.ellipse((x - r, y - r, x + r, y + r), fill=fill)
+            else:
+                draw.rectangle((x - r, y - r, x + r, y + r), fill=fill)
+
+        return im
+
+    def _encode(self, im):
+        buf = io.BytesIO()
+        im.save(buf, format="PNG")
+        return buf.getvalue()
+
+
+def min_samples_for(pct, floor=20):
+    # With fewer samples than this the percentile is just the slowest request seen
+    return max(floor, math.floor(100 / (100 - pct)) + 1)
+
+
+class LatencyTracker:
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        if not 0 < pct < 100:
+            raise ValueError(f"percentile must be between 0 and 100, got {pct:g}")
+
+        with self._lock:
+            samples = sorted(self._samples)
+
+        if len(samples) < min_samples_for(pct):
+            return None
+
+        # Nearest-rank percentile
+        index = max(0, math.ceil(len(samples) * pct / 100) - 1)
+        return samples[index]
+
+
+latency_trackers = {}
+latency_lock = threading.Lock()
+
+
+def latency_tracker(backend_name, operation):
+    # Generate and edit have very different latencies, so track them separately
+    with latency_lock:
+        key = (backend_name, operation)
+        if key not in latency_trackers:
+            # Hold at least twice the samples the hedge percentile needs, or it can never kick in
+            latency_trackers[key] = LatencyTracker(size=max(200, 2 * min_samples_for(hedge_percentile)))
+        return latency_trackers[key]
+
+
+class RequestState:
+    # Shared between a backend call and the HedgedBackend watching it. on_wire_since is set
+    # only while a request is actually with the upstream, not while it queues for a
+    # concurrency slot or sleeps in rate-limit backoff. cancelled is set once the hedge has
+    # its answer, so an attempt that hasn't reached the upstream yet gives up
+    def __init__(self, group=None):
+        self.on_wire_since = None
+        # Attempts of one hedged request share the event, so cancelling one cancels them all
+        self._cancel = group if group is not None else threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+
+class HedgedBackend:
+    # Sends a second, identical request once the first has been on the wire longer than the
+    # given latency percentile, and returns whichever answer arrives first
+    def __init__(self, backend, percentile=95, fallback_delay=60):
+        self.backend = backend
+        self.name = backend.name
+        self.percentile = percentile
+        self.fallback_delay = fallback_delay
+
+    def generate(self, prompt):
+        return self._hedge("generate", self.backend.generate, prompt)
+
+    def edit(self, prompt, image_path):
+        return self._hedge("edit", self.backend.edit, prompt, image_path)
+
+    def hedge_delay(self, operation):
+        delay = latency_tracker(self.name, operation).percentile(self.percentile)
+        return self.fallback_delay if delay is None else delay
+
+    def _attempt(self, results, fn, args, state):
+        try:
+            results.put((True, fn(*args, state=state)))
+        except Exception as e:
+            results.put((False, e))
+
+    def _start(self, results, fn, args, group):
+        state = RequestState(group)
+        # Daemon threads, so a losing request still in flight never holds up quitting the app
+        threading.Thread(target=self._attempt, args=(results, fn, args, state), daemon=True).start()
+        return state
+
+    def _hedge(self, operation, fn, *args):
+        results = queue.Queue()
+        delay = self.hedge_delay(operation)
+
+        group = threading.Event()
+        state = self._start(results, fn, args, group)
+        try:
+            return self._wait(results, delay, fn, args, state, group)
+        finally:
+            group.set()
+
+    def _wait(self, results, delay, fn, args, state, group):
+        launched = 1
+        finished = 0
+
+        while True:
+            if launched == 1:
+                # Only the time actually spent with the upstream counts towards the hedge delay;
+                # hedging while queued for a slot or backing off from a 429 would only add load
+                on_wire_since = state.on_wire_since
+                if on_wire_since is None:
+                    timeout = 0.25
+                else:
+                    timeout = delay - (time.monotonic() - on_wire_since)
+
+                if timeout <= 0:
+                    print(f"No response after {delay:.1f}s, sending hedge request")
+                    self._start(results, fn, args, group)
+                    launched = 2
+                    continue
+            else:
+                timeout = None
+
+            try:
+                ok, value = results.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+            finished += 1
+            if ok:
+                return value
+            if finished == launched:
+                raise value
+
+
+def make_backend():
+    if image_backend == "local":
+        backend = LocalBackend()
+    else:
+        backend = OpenAIBackend(client, retries=max_retries)
+
+    if hedge_enabled:
+        backend = HedgedBackend(backend, percentile=hedge_percentile, fallback_delay=hedge_delay_s)
+
+    return backend
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -88,7 +509,13 @@ class MainWindow(QMainWindow):
 
         self.submit_prompt.clicked.connect(self.on_generate_press)
 
-        spacer2 = QSpacerItem(20, 10, QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed)
+        self.concurrency_label = QLabel()
+        self.concurrency_label.setStyleSheet("font-size: 10px; color: #b0b8c8;")
+
+        self.concurrency_timer = QTimer(self)
+        self.concurrency_timer.timeout.connect(self.update_concurrency_label)
+        self.concurrency_timer.start(500)
+        self.update_concurrency_label()
 
         go_saved_images = QPushButton("Saved Images")
         go_saved_images.setFixedWidth(150)
@@ -100,10 +527,19 @@ class MainWindow(QMainWindow):
         layout.addItem(spacer)
         layout.addWidget(self.submit_prompt, alignment=Qt.AlignmentFlag.AlignHCenter)
         layout.addWidget(go_saved_images, alignment=Qt.AlignmentFlag.AlignHCenter)
-        layout.addItem(spacer2)
+        layout.addWidget(self.concurrency_label, alignment=Qt.AlignmentFlag.AlignHCenter)
 
         self.prompt_page.setLayout(layout)
 
+
+    def update_concurrency_label(self):
+        if image_backend == "local":
+            self.concurrency_label.setText("Local backend")
+            return
+
+        window, in_flight = get_controller(api_key).snapshot()
+        self.concurrency_label.setText(f"Concurrency window: {window:.1f}  |  In flight: {in_flight}")
+
     
     def build_env_page(self):
         layout = QVBoxLayout()
@@ -225,13 +661,15 @@ class MainWindow(QMainWindow):
 
 
     def on_generate_press(self):
-        if api_key == '':
+        has_key = api_key != '' or image_backend == "local"
+
+        if not has_key:
             DialogueBox("You must set your OpenAI API key to use the app", self).exec()
             self.stack.setCurrentWidget(self.env_page)
 
         prompt = self.prompt_input.text()
 
-        if prompt and api_key: 
+        if prompt and has_key: 
 
             print(f"Prompt: {prompt}")
 
@@ -242,7 +680,7 @@ class MainWindow(QMainWindow):
             prompt = prompt,
             image_path = getattr(self, 'uploaded_file', None),
             is_image_added = self.is_image_added,
-            client = client
+            backend = make_backend()
             )
 
             runnable.signals.finished.connect(self.on_image_generated)
@@ -250,7 +688,7 @@ class MainWindow(QMainWindow):
 
             QThreadPool.globalInstance().start(runnable)
 
-        elif prompt == '' and api_key:
+        elif prompt == '' and has_key:
             msg = "Please enter a prompt"
             dlg = DialogueBox(msg, self)
             dlg.exec()
@@ -341,17 +779,66 @@ class MainWindow(QMainWindow):
         self.saved_images.addItems(items)
         self.saved_images.sortItems()
         self.saved_images.itemDoubleClicked.connect(self.open_image)
+        self.saved_images.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
 
         back_btn = QPushButton("Back")
         back_btn.clicked.connect(lambda: self.stack.setCurrentWidget(self.prompt_page))
 
+        self.export_btn = QPushButton("Export Renditions")
+        self.export_btn.clicked.connect(self.export_renditions)
+
+        btn_row = QHBoxLayout()
+        btn_row.addWidget(back_btn)
+        btn_row.addWidget(self.export_btn)
+
         #layout.addWidget(title, alignment=Qt.AlignmentFlag.AlignHCenter)
         layout.addWidget(self.saved_images)
-        layout.addWidget(back_btn, alignment=Qt.AlignmentFlag.AlignHCenter)
+        layout.addLayout(btn_row)
 
         self.image_repo.setLayout(layout)
 
 
+    def export_renditions(self):
+        selected = self.saved_images.selectedItems()
+        if not selected:
+            DialogueBox("Select one or more images to export", self).exec()
+            return
+
+        dst_dir = QFileDialog.getExistingDirectory(self, "Export Renditions To…", QDir.homePath())
+        if not dst_dir:
+            return
+
+        try:
+            presets = load_export_presets(export_presets_path())
+        except (OSError, ValueError) as e:
+            DialogueBox(f"Could not load export presets:\n{e}", self).exec()
+            return
+
+        self.export_btn.setEnabled(False)
+
+        runnable = ExportWorker(
+        sources = [os.path.join(base, "images", f"{item.text()}.png") for item in selected],
+        dst_dir = dst_dir,
+        presets = presets
+        )
+
+        runnable.signals.finished.connect(self.on_export_finished)
+        runnable.signals.error.connect(self.on_export_error)
+
+        QThreadPool.globalInstance().start(runnable)
+
+    @Slot(str)
+    def on_export_finished(self, dst_dir):
+        self.export_btn.setEnabled(True)
+        DialogueBox(f"Renditions saved to {dst_dir}", self).exec()
+
+    @Slot(Exception)
+    def on_export_error(self, ex):
+        self.export_btn.setEnabled(True)
+        print("Error:", ex)
+        DialogueBox(f"Error exporting renditions:\n{ex}", self).exec()
+
+
     def closeEvent(self, event):
         if self.image_window is not None:
             self.image_window.close()
@@ -384,14 +871,14 @@ class WorkerSignals(QObject):
 
 
 class Worker(QRunnable):
-    def __init__(self, prompt, image_path, is_image_added, client):
+    def __init__(self, prompt, image_path, is_image_added, backend):
         super().__init__()
         
         self.signals = WorkerSignals()
         self.prompt = prompt
         self.image_path = image_path
         self.is_image_added = is_image_added
-        self.client = client
+        self.backend = backend
     
     def run(self):
 
@@ -401,22 +888,11 @@ class Worker(QRunnable):
         try:
             if self.is_image_added and self.image_path is not None: 
                 print(f"Submitting prompt with {os.path.splitext(os.path.basename(self.image_path))[0]}")
-                result = client.images.edit(
-                    model="gpt-image-1",
-                    image=open(self.image_path, "rb"),
-                    prompt=self.prompt
-                )
+                image_bytes = self.backend.edit(self.prompt, self.image_path)
 
             else:
                 print("Submitting prompt with no image")
-                result = client.images.generate(
-                    model="gpt-image-1",
-                    prompt=self.prompt,
-                    quality="high"
-                )
-        
-            image_base64 = result.data[0].b64_json
-            image_bytes = base64.b64decode(image_base64)
+                image_bytes = self.backend.generate(self.prompt)
 
             with open(f"{file_name}.png", "wb") as f:
                 f.write(image_bytes)
@@ -427,6 +903,45 @@ class Worker(QRunnable):
             self.signals.error.emit(e)
 
 
+class ExportWorker(QRunnable):
+    def __init__(self, sources, dst_dir, presets):
+        super().__init__()
+
+        self.signals = WorkerSignals()
+        self.sources = sources
+        self.dst_dir = dst_dir
+        self.presets = presets
+
+    def run(self):
+        cache_dir = os.path.join(base, "renditions")
+
+        try:
+            # A single image gains nothing from another process, so render it on this thread
+            if len(self.sources) == 1:
+                rendered = {self.sources[0]: render_renditions(self.sources[0], self.presets, cache_dir)}
+            else:
+                pool = get_pool()
+                futures = {
+                    source: pool.submit(render_renditions, source, self.presets, cache_dir)
+                    for source in self.sources
+                }
+                rendered = {source: future.result() for source, future in futures.items()}
+
+            count = 0
+            for source, results in rendered.items():
+                stem = os.path.splitext(os.path.basename(source))[0]
+                for name, cached in results.items():
+                    ext = os.path.splitext(cached)[1]
+                    shutil.copy(cached, os.path.join(self.dst_dir, f"{stem}_{name}{ext}"))
+                    count += 1
+
+            print(f"Exported {count} renditions to {self.dst_dir}")
+            self.signals.finished.emit(self.dst_dir)
+
+        except Exception as e:
+            self.signals.error.emit(e)
+
+
 class ImageWindow(QMainWindow):
 
     file_changed = Signal()
@@ -450,6 +965,10 @@ class ImageWindow(QMainWindow):
         export_image.triggered.connect(self.export_file)
         tool_bar.addAction(export_image)
 
+        self.export_renditions_action = QAction("Export Renditions", self)
+        self.export_renditions_action.triggered.connect(self.export_renditions)
+        tool_bar.addAction(self.export_renditions_action)
+
         edit_file_name = QAction("Change Filename", self)
         edit_file_name.triggered.connect(self.edit_file_name)
         tool_bar.addAction(edit_file_name)
@@ -525,6 +1044,42 @@ class ImageWindow(QMainWindow):
             shutil.copy(self.image, dst)
             self.statusBar().showMessage(f"Saved to {dst}", 3000)
 
+    def export_renditions(self):
+        dst_dir = QFileDialog.getExistingDirectory(self, "Export Renditions To…", QDir.homePath())
+        if not dst_dir:
+            return
+
+        try:
+            presets = load_export_presets(export_presets_path())
+        except (OSError, ValueError) as e:
+            self.statusBar().showMessage(f"Could not load export presets: {e}", 5000)
+            return
+
+        runnable = ExportWorker(
+        sources = [self.image],
+        dst_dir = dst_dir,
+        presets = presets
+        )
+
+        runnable.signals.finished.connect(self.on_export_finished)
+        runnable.signals.error.connect(self.on_export_error)
+
+        self.export_renditions_action.setEnabled(False)
+        self.statusBar().showMessage("Exporting renditions…")
+        QThreadPool.globalInstance().start(runnable)
+
+    @Slot(str)
+    def on_export_finished(self, dst_dir):
+        self.export_renditions_action.setEnabled(True)
+        self.statusBar().showMessage(f"Renditions saved to {dst_dir}", 3000)
+
+    @Slot(Exception)
+    def on_export_error(self, ex):
+        self.export_renditions_action.setEnabled(True)
+        self.statusBar().clearMessage()
+        print("Error:", ex)
+        DialogueBox(f"Error exporting renditions:\n{ex}", self).exec()
+
     def edit_file_name(self):
         dlg = InputDialog("Change Filename", f"{os.path.splitext(os.path.basename(self.image))[0]}", self)
         dlg.setFixedWidth(300)
@@ -590,7 +1145,7 @@ class ImageWindow(QMainWindow):
             prompt = prompt,
             image_path = self.image,
             is_image_added = self.is_image_added,
-            client = client
+            backend = make_backend()
             )
 
             runnable.signals.finished.connect(self.on_image_generated)
@@ -726,11 +1281,163 @@ class CustomSpinner(QWidget):
             painter.rotate(360 / self.line_count)
 
 
+class StallWatchdog(QObject):
+    def __init__(self, threshold_ms=250, heartbeat_ms=50, report_path=None):
+        super().__init__()
+        self.threshold = threshold_ms / 1000
+        self.heartbeat_ms = heartbeat_ms
+        self.report_path = report_path or os.path.join(base, "stall_report.txt")
+
+        # call site -> {"count", "total", "max", "samples", "stack"}
+        self.stalls = {}
+
+        self._main_ident = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stall_start = None
+        self._sites = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="stall-watchdog", daemon=True)
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._beat)
+
+    def start(self):
+        self._last_beat = time.monotonic()
+        self._timer.start(self.heartbeat_ms)
+        self._thread.start()
+        print(f"Stall watchdog running (threshold {int(self.threshold * 1000)} ms)")
+
+    def stop(self):
+        self._timer.stop()
+        self._stop.set()
+        self._thread.join(timeout=1)
+
+        # A stall still in progress at quit is usually the one that made the user quit
+        if self._stall_start is not None and self._sites:
+            self._record(self._sites, time.monotonic() - self._stall_start)
+            self._stall_start = None
+
+        self.write_report()
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+
+    def _sample(self):
+        frame = sys._current_frames().get(self._main_ident)
+        if frame is None:
+            return None, []
+
+        stack = traceback.extract_stack(frame)
+
+        # Attribute the stall to the innermost frame in our own code, so a freeze inside
+        # os.listdir or QPixmap is reported against the line that called it
+        site = stack[-1]
+        for entry in reversed(stack):
+            if os.path.abspath(entry.filename) == os.path.abspath(__file__):
+                site = entry
+                break
+
+        # Nothing of ours above app.exec(): native paint/layout work or the OS throttling our
+        # timers (e.g. App Nap), not a line we can fix
+        if site.name == "<module>" and os.path.abspath(site.filename) == os.path.abspath(__file__):
+            return "<Qt event loop>", stack
+
+        return f"{os.path.basename(site.filename)}:{site.lineno} in {site.name}", stack
+
+    def _watch(self):
+        poll = self.threshold / 4
+
+        while not self._stop.wait(poll):
+            last_beat = self._last_beat
+            lag = time.monotonic() - last_beat
+
+            if lag > self.threshold:
+                if self._stall_start is None:
+                    self._stall_start = last_beat
+                    self._sites = {}
+
+                # site -> [samples, first stack seen at that site]
+                site, stack = self._sample()
+                if site is not None:
+                    self._sites.setdefault(site, [0, stack])[0] += 1
+
+            elif self._stall_start is not None:
+                if self._sites:
+                    self._record(self._sites, last_beat - self._stall_start)
+                self._stall_start = None
+
+    def _record(self, sites, duration):
+        site = max(sites, key=lambda s: sites[s][0])
+        stack = sites[site][1]
+
+        with self._lock:
+            entry = self.stalls.setdefault(site, {"count": 0, "total": 0.0, "max": 0.0, "samples": 0, "stack": stack})
+            entry["count"] += 1
+            entry["total"] += duration
+            entry["samples"] += sum(count for count, _ in sites.values())
+
+            # Keep the stack from the worst stall at this site
+            if duration >= entry["max"]:
+                entry["max"] = duration
+                entry["stack"] = stack
+
+        print(f"UI stall: {int(duration * 1000)} ms at {site}")
+
+        # Rewrite the report as we go so it survives a force-quit
+        self._save_report()
+
+    def report(self):
+        lines = [f"Main-thread stalls over {int(self.threshold * 1000)} ms", ""]
+
+        with self._lock:
+            ranked = sorted(self.stalls.items(), key=lambda kv: kv[1]["total"], reverse=True)
+
+        if not ranked:
+            lines.append("No stalls recorded")
+
+        for site, entry in ranked:
+            lines.append(
+                f"{site}: {entry['count']} stalls, total {int(entry['total'] * 1000)} ms, "
+                f"max {int(entry['max'] * 1000)} ms, {entry['samples']} samples"
+            )
+            for frame in traceback.format_list(entry["stack"]):
+                lines.extend("    " + line for line in frame.rstrip().splitlines())
+            lines.append("")
+
+        return "\n".join(lines)
+
+    def write_report(self):
+        print(self.report())
+        self._save_report()
+
+    def _save_report(self):
+        text = self.report()
+
+        with self._lock:
+            try:
+                with open(self.report_path, "w") as f:
+                    f.write(text)
+            except OSError as e:
+                print(f"Could not write stall report: {e}")
+
+
 if __name__ == "__main__":
+    freeze_support()
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
+    # Workers wait on the concurrency controller, so give it threads beyond the CPU-based default
+    QThreadPool.globalInstance().setMaxThreadCount(QThreadPool.globalInstance().maxThreadCount() + max_concurrency)
     app.setApplicationName("Image Gen")
     app.setWindowIcon(QIcon("icon.icns"))
     window = MainWindow()
     window.show()
+
+    app.aboutToQuit.connect(shutdown_pool)
+
+    if watchdog_enabled:
+        watchdog = StallWatchdog(threshold_ms=watchdog_threshold_ms)
+        watchdog.start()
+        app.aboutToQuit.connect(watchdog.stop)
+
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from PIL import Image, ImageOps
+
+# No Qt or openai imports here, so render_renditions can be pickled to a worker process
+# without dragging GUI state along. Spawned workers still re-import the main script
+# (app.py) once each, Qt and all, which is why get_pool keeps one pool for the session
+
+
+# mode "fit" scales the whole image into the box, "crop" fills the box and trims the overflow
+DEFAULT_EXPORT_PRESETS = {
+    "web_thumbnail": {"width": 256, "height": 256, "mode": "fit", "format": "WEBP", "quality": 80},
+    "social_crop": {"width": 1200, "height": 630, "mode": "crop", "format": "JPEG", "quality": 90},
+    "print": {"width": 3072, "height": 3072, "mode": "fit", "format": "PNG"},
+}
+
+FORMAT_EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp", "TIFF": "tif"}
+EXPORT_MODES = ("fit", "crop")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def load_export_presets(path):
+    if not os.path.exists(path):
+        return dict(DEFAULT_EXPORT_PRESETS)
+
+    with open(path) as f:
+        try:
+            presets = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"{os.path.basename(path)} is not valid JSON: {e}")
+
+    validate_presets(presets)
+    return presets
+
+
+def validate_presets(presets):
+    if not isinstance(presets, dict) or not presets:
+        raise ValueError("Export presets must be a non-empty object of preset name -> settings")
+
+    for name, preset in presets.items():
+        if not name or os.sep in name or (os.altsep and os.altsep in name):
+            raise ValueError(f"Preset name '{name}' can't be used in a filename")
+
+        if not isinstance(preset, dict):
+            raise ValueError(f"Preset '{name}' must be an object")
+
+        for key in ("width", "height"):
+            value = preset.get(key)
+            if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+                raise ValueError(f"Preset '{name}' needs a positive whole number for '{key}'")
+
+        mode = preset.get("mode", "fit")
+        if mode not in EXPORT_MODES:
+            raise ValueError(f"Preset '{name}' has unknown mode '{mode}' (use {' or '.join(EXPORT_MODES)})")
+
+        fmt = preset.get("format", "PNG")
+        if not isinstance(fmt, str) or fmt.upper() not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Preset '{name}' has unsupported format '{fmt}' (use {', '.join(FORMAT_EXTENSIONS)})")
+
+        quality = preset.get("quality", 90)
+        if isinstance(quality, bool) or not isinstance(quality, int) or not 1 <= quality <= 100:
+            raise ValueError(f"Preset '{name}' needs a 'quality' between 1 and 100")
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def preset_key(name, preset):
+    spec = json.dumps(preset, sort_keys=True)
+    return f"{name}-{hashlib.sha256(spec.encode()).hexdigest()[:8]}"
+
+
+def render_renditions(source, presets, cache_dir):
+    # Decode the source at most once and write every preset that isn't already cached.
+    # Returns {preset name: cached file}
+    source_hash = file_hash(source)[:16]
+    results = {}
+    missing = {}
+
+    for name, preset in presets.items():
+        ext = FORMAT_EXTENSIONS[preset.get("format", "PNG").upper()]
+        cached = os.path.join(cache_dir, f"{source_hash}_{preset_key(name, preset)}.{ext}")
+        results[name] = cached
+        if not os.path.exists(cached):
+            missing[name] = preset
+
+    if not missing:
+        return results
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with Image.open(source) as im:
+        im.load()
+
+        for name, preset in missing.items():
+            size = (preset["width"], preset["height"])
+
+            if preset.get("mode", "fit") == "crop":
+                out = ImageOps.fit(im, size, Image.LANCZOS)
+            else:
+                scale = min(size[0] / im.width, size[1] / im.height)
+                out = im.resize((max(1, round(im.width * scale)), max(1, round(im.height * scale))), Image.LANCZOS)
+
+            fmt = preset.get("format", "PNG").upper()
+            if fmt == "JPEG" and out.mode != "RGB":
+                out = out.convert("RGB")
+
+            options = {"quality": preset["quality"]} if "quality" in preset else {}
+
+            # Write to a temp name first so a half-written file never looks like a cache hit
+            tmp = f"{results[name]}.{os.getpid()}.{threading.get_ident()}.tmp"
+            out.save(tmp, format=fmt, **options)
+            os.replace(tmp, results[name])
+
+    return results
+
+
+def get_pool():
+    # One long-lived pool for the whole session, so each worker's startup (including the
+    # re-import of app.py that spawn does) is paid once. Spawn rather than fork, since the
+    # parent is a multithreaded Qt process
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None